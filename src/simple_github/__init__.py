@@ -1,10 +1,32 @@
 import asyncio
 from typing import List, Optional, Union
 
-from .auth import AppAuth, AppInstallationAuth, PublicAuth, TokenAuth
+from .auth import AppAuth, AppInstallationAuth, Auth, PublicAuth, TokenAuth
 from .client import AsyncClient, Client, SyncClient
 
 
+def _is_async_context() -> bool:
+    """Return whether we're being called from within a running event loop.
+
+    Uses `asyncio._get_running_loop`, which returns `None` rather than raising
+    `RuntimeError` when there is no running loop.
+    """
+    return asyncio._get_running_loop() is not None
+
+
+def _make_client(auth: Auth) -> Client:
+    """Create an `AsyncClient` or `SyncClient` depending on whether we're
+    running in an async context.
+
+    Args:
+        auth (Auth): The authentication to use for the client.
+
+    Returns:
+        Client: A client authenticated with `auth`.
+    """
+    return (AsyncClient if _is_async_context() else SyncClient)(auth=auth)
+
+
 def AppClient(
     id: int,
     privkey: str,
@@ -31,16 +53,10 @@ def AppClient(
     Returns:
         Client: A client authenticated as the app.
     """
-    try:
-        asyncio.get_running_loop()
-        is_async = True
-    except RuntimeError:
-        is_async = False
-
     auth = AppAuth(id, privkey)
     if owner:
         auth = AppInstallationAuth(auth, owner, repositories=repositories)
-    return AsyncClient(auth=auth) if is_async else SyncClient(auth=auth)
+    return _make_client(auth)
 
 
 def TokenClient(token: str) -> Client:
@@ -52,14 +68,7 @@ def TokenClient(token: str) -> Client:
 
     Returns:
         Client: A client authenticated with the token."""
-    try:
-        asyncio.get_running_loop()
-        is_async = True
-    except RuntimeError:
-        is_async = False
-
-    auth = TokenAuth(token)
-    return AsyncClient(auth=auth) if is_async else SyncClient(auth=auth)
+    return _make_client(TokenAuth(token))
 
 
 def PublicClient() -> Client:
@@ -67,11 +76,4 @@ def PublicClient() -> Client:
 
     Returns:
         Client: A client without any authentication."""
-    try:
-        asyncio.get_running_loop()
-        is_async = True
-    except RuntimeError:
-        is_async = False
-
-    auth = PublicAuth()
-    return AsyncClient(auth=auth) if is_async else SyncClient(auth=auth)
+    return _make_client(PublicAuth())
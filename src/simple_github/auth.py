@@ -1,22 +1,53 @@
+import asyncio
+import base64
+import json
 import time
-from abc import ABC, abstractmethod
-from typing import Any, AsyncGenerator, AsyncIterator, List, Optional, Union
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
 
-import jwt
+from simple_github.client import AsyncClient, _prune_closed_loops
 
-from simple_github.client import AsyncClient
+if TYPE_CHECKING:
+    from cryptography.hazmat.primitives.asymmetric.rsa import (
+        RSAPrivateKey,
+        RSAPublicNumbers,
+    )
 
 
-# For compatibility with Python <3.10.
-async def anext(ait: AsyncIterator[Any]):
-    return await ait.__anext__()
+def _b64encode(data: bytes) -> bytes:
+    """Base64url encode `data` without padding, as used in JSON Web Tokens."""
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
 
 
-class Auth(ABC):
-    @abstractmethod
+# The JWT header never changes, so only encode it once.
+_JWT_HEADER = _b64encode(b'{"alg":"RS256","typ":"JWT"}')
+
+
+class Auth:
+    __slots__ = ()
+
     async def get_token(self) -> str:
-        """Returns"""
-        ...
+        """Get the token to authenticate with.
+
+        Returns:
+            str: The authentication token.
+        """
+        raise NotImplementedError
+
+    def sync_token(self) -> Optional[str]:
+        """Return the token without awaiting, if it never changes.
+
+        Returns:
+            str: The token, or `None` if `get_token` needs to be awaited.
+        """
+        return None
+
+    @property
+    def expires_at(self) -> Optional[float]:
+        """The `time.time()` timestamp the last token from `get_token` expires
+        at, or `None` if it isn't known.
+        """
+        return None
 
     async def close(self) -> None:
         """Close the authentication if necessary."""
@@ -26,11 +57,18 @@ class Auth(ABC):
 class PublicAuth(Auth):
     """Shim for unauthenticated API access."""
 
+    __slots__ = ()
+
     async def get_token(self) -> str:
         return ""
 
+    def sync_token(self) -> str:
+        return ""
+
 
 class TokenAuth(Auth):
+    __slots__ = ("_token",)
+
     def __init__(self, token: str):
         """Authentication for an access token.
 
@@ -47,9 +85,19 @@ class TokenAuth(Auth):
         """
         return self._token
 
+    def sync_token(self) -> str:
+        """Get the access token without awaiting.
+
+        Returns:
+            str: The access token.
+        """
+        return self._token
+
 
 class AppAuth(Auth):
-    def __init__(self, app_id: int, privkey: str):
+    __slots__ = ("id", "_privkey", "_iss_claim", "_token", "_expires_at")
+
+    def __init__(self, app_id: int, privkey: Union[str, bytes]):
         """Authentication for a Github app.
 
         Args:
@@ -57,50 +105,139 @@ class AppAuth(Auth):
             privkey (str): A base64 encoded private key associated with the
                 app.
         """
-        self.id = app_id
-        self._privkey = privkey
-        self._generator = self._gen_jwt()
+        # Imported here so token and public clients don't need to load
+        # cryptography.
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        from cryptography.hazmat.primitives.serialization import load_pem_private_key
 
-    async def _gen_jwt(self) -> AsyncGenerator[str, None]:
-        """Generates a JSON Web Token (JWT).
+        self.id = app_id
+        # Parse the key up front so it isn't re-parsed each time a JWT is signed.
+        if isinstance(privkey, str):
+            privkey = privkey.encode()
+        key = load_pem_private_key(privkey, password=None)
+        if not isinstance(key, rsa.RSAPrivateKey):
+            raise ValueError("Github App private keys must be RSA keys!")
+        self._privkey: RSAPrivateKey = key
+        # The tail of the JWT payload, only the timestamps change between tokens.
+        self._iss_claim = f',"iss":{json.dumps(app_id)}}}'
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+
+    def _encode_jwt(self, issued_at: int) -> str:
+        """Create a JSON Web Token (JWT) signed by `privkey`.
+
+        This is equivalent to `jwt.encode(payload, privkey, algorithm="RS256")`,
+        but avoids serializing the constant header and `iss` claim each time.
 
-        The token will expire in 9 minutes but subsequent calls to this function
-        will yield the same token as long as there is more than a minute remaining
-        before its expiry. After which point, a new token will be generated.
+        Args:
+            issued_at (int): The time the token is issued at.
 
-        Yields:
-            str: JSON Web Token
+        Returns:
+            str: The signed JSON web token.
         """
-        issued_at = int(time.time())
-        payload = {
-            "iat": issued_at,
-            "exp": issued_at + 540,
-            "iss": self.id,
-        }
-
-        token = jwt.encode(payload, self._privkey, algorithm="RS256")
-
-        while True:
-            current = int(time.time())
-            # Refresh the token a minute before expiry.
-            if payload["exp"] - current < 60:
-                payload["iat"] = current
-                payload["exp"] = current + 540
-                token = jwt.encode(payload, self._privkey, algorithm="RS256")
-            yield token
+        from cryptography.hazmat.primitives.asymmetric.padding import PKCS1v15
+        from cryptography.hazmat.primitives.hashes import SHA256
+
+        payload = f'{{"iat":{issued_at},"exp":{issued_at + 540}{self._iss_claim}'
+        signing_input = _JWT_HEADER + b"." + _b64encode(payload.encode())
+        signature = self._privkey.sign(signing_input, PKCS1v15(), SHA256())
+        return (signing_input + b"." + _b64encode(signature)).decode()
 
     async def get_token(self) -> str:
         """Get the JSON web token (JWT) signed by `privkey`.
 
-        If the token is about to expire, it will automatically be re-generated.
+        The token will expire in 9 minutes but subsequent calls to this function
+        will return the same token as long as there is more than a minute remaining
+        before its expiry. After which point, a new token will be generated.
 
         Returns:
             str: The signed JSON web token.
         """
-        return await anext(self._generator)
+        # Github checks the token's `exp` claim against wall-clock time, so
+        # compare against `time.time()`. Unlike the monotonic clock, that keeps
+        # advancing while the machine is suspended.
+        now = int(time.time())
+        token = self._token
+        if token is not None and self._expires_at - now >= 60:
+            return token
+
+        # Refresh the token a minute before expiry.
+        self._expires_at = now + 540
+        token = self._token = self._encode_jwt(now)
+        return token
+
+    @property
+    def expires_at(self) -> float:
+        """The `time.time()` timestamp the current token expires at."""
+        return self._expires_at
+
+
+# An app's id and public key.
+_AppKey = Tuple[int, "RSAPublicNumbers"]
+_AppClients = Dict[_AppKey, Tuple[AsyncClient, int]]
+
+# Clients used to create installation tokens, shared between all installations
+# of an app in an event loop so they re-use the same connections. Maps the loop
+# to the app's key, the client and the number of `AppInstallationAuth`
+# instances using it. Closed loops are pruned as for the shared connectors.
+_app_clients: Dict[asyncio.AbstractEventLoop, _AppClients] = {}
+
+
+def _acquire_app_client(app: AppAuth) -> AsyncClient:
+    """Return the client authenticated as `app`, shared by installations in
+    the running event loop.
+
+    Args:
+        app (AppAuth): Authentication for the Github app.
+
+    Returns:
+        AsyncClient: A client authenticated as the app.
+    """
+    _prune_closed_loops(_app_clients)
+    clients = _app_clients.setdefault(asyncio.get_running_loop(), {})
+    # The key is included, as apps with the same id but different keys can't
+    # share a client.
+    key = (app.id, app._privkey.public_key().public_numbers())
+    if key in clients:
+        client, refs = clients[key]
+    else:
+        client, refs = AsyncClient(auth=app), 0
+    clients[key] = (client, refs + 1)
+    return client
+
+
+async def _release_app_client(client: AsyncClient) -> None:
+    """Release a shared app client, closing it if it is no longer used.
+
+    Args:
+        client (AsyncClient): The client to release.
+    """
+    for loop, clients in list(_app_clients.items()):
+        for key, (shared, refs) in clients.items():
+            if shared is client:
+                if refs > 1:
+                    clients[key] = (shared, refs - 1)
+                else:
+                    del clients[key]
+                    if not clients:
+                        del _app_clients[loop]
+                    await client.close()
+                return
 
 
 class AppInstallationAuth(Auth):
+    __slots__ = (
+        "app",
+        "owner",
+        "repositories",
+        "_data",
+        "_client",
+        "_installation_id",
+        "_token",
+        "_exp",
+        "_lock",
+    )
+
     def __init__(
         self,
         app: AppAuth,
@@ -123,12 +260,41 @@ class AppInstallationAuth(Auth):
         self.app = app
         self.owner = owner
         self.repositories = repositories
-        self._client = AsyncClient(auth=self.app)
-        self._generator = self._gen_installation_token()
+        self._data = {}
+        if repositories:
+            # Ensures the token is only valid for the given repos.
+            self._data["repositories"] = repositories
+        # Only acquired once a token is needed.
+        self._client: Optional[AsyncClient] = None
+        self._installation_id: Optional[str] = None
+        self._token: Optional[str] = None
+        self._exp = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+
+    @property
+    def expires_at(self) -> float:
+        """The `time.time()` timestamp the current token expires at."""
+        return self._exp
 
     async def close(self) -> None:
-        """Close the Client used to fetch the installation token."""
-        await self._client.close()
+        """Release the Client used to fetch the installation token.
+
+        The client is shared with other installations of the same app, and is
+        only closed once none of them are using it anymore.
+        """
+        if self._client is not None:
+            client, self._client = self._client, None
+            await _release_app_client(client)
+
+    def _get_client(self) -> AsyncClient:
+        """Return the client used to fetch the installation token.
+
+        Returns:
+            AsyncClient: A client authenticated as the app.
+        """
+        if self._client is None:
+            self._client = _acquire_app_client(self.app)
+        return self._client
 
     async def _get_installation_id(self) -> str:
         """Return the app's installation id for owner.
@@ -136,64 +302,56 @@ class AppInstallationAuth(Auth):
         Returns:
             str: The app's installation id.
         """
-        async with await self._client.get("/app/installations") as response:
-            response.raise_for_status()
-            installations = await response.json()
-        assert isinstance(installations, list)
-
-        for installation in installations:
-            if installation["account"]["login"] == self.owner:
-                return installation["id"]
+        # Owner may be either a user or an organization.
+        for query in (
+            f"/users/{self.owner}/installation",
+            f"/orgs/{self.owner}/installation",
+        ):
+            async with await self._get_client().get(query) as response:
+                if response.status == 404:
+                    continue
+                response.raise_for_status()
+                installation = await response.json()
+            assert isinstance(installation, dict)
+            return installation["id"]
 
         raise Exception(
             f"Github App '{self.app.id}' is not installed with owner '{self.owner}'!"
         )
 
-    async def _gen_installation_token(self) -> AsyncGenerator[str, None]:
-        """Generates a Github App installation access token for the given owner
-        and repositories.
-
-        Subsequent iterations of this generator return the same token until it
-        expires, or is about to expire. After which, a new token is generated.
-
-        Args:
-            owner (str): The Github org or user where the app is installed.
-            repos (List[str]): A list of repositories under <owner> to restrict
-                access to. If not provided, the token will have access to all
-                repositories.
-
-        Yields:
-            str: An app installation access token scoped to the given repositories.
-        """
-        installation_id = await self._get_installation_id()
-        query = f"/app/installations/{installation_id}/access_tokens"
-        data = {}
-        if self.repositories:
-            # Ensures the token is only valid for the current repo.
-            data["repositories"] = self.repositories
-
-        async def _gentoken() -> str:
-            response = await self._client.post(query, data=data)
-            response.raise_for_status()
-            result = await response.json()
-            assert isinstance(result, dict)
-            return result["token"]
-
-        token = await _gentoken()
-        exp = int(time.time()) + 3600  # tokens are valid for one hour
-        while True:
-            cur = int(time.time())
-            if exp - cur < 60:
-                # token is about to expire, refresh it
-                token = await _gentoken()
-                exp = int(time.time()) + 3600
-            yield token
-
     async def get_token(self) -> str:
         """Get the installation access token.
 
-        If the token is about to expire, it will automatically be re-generated.
+        Subsequent calls return the same token until it expires, or is about to
+        expire. After which, a new token is generated.
 
         Returns:
-            str: The installation access token."""
-        return await anext(self._generator)
+            str: An app installation access token scoped to `repositories`."""
+        # Github's `expires_at` is wall-clock time, so compare it against
+        # `time.time()`. Unlike the monotonic clock, that keeps advancing while
+        # the machine is suspended.
+        token = self._token
+        if token is not None and self._exp - time.time() >= 60:
+            return token
+
+        # Token is missing or about to expire. Only let a single task refresh
+        # it, the others wait and re-use the new token.
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            token = self._token
+            if token is None or self._exp - time.time() < 60:
+                if self._installation_id is None:
+                    self._installation_id = await self._get_installation_id()
+
+                query = f"/app/installations/{self._installation_id}/access_tokens"
+                response = await self._get_client().post(query, data=self._data)
+                response.raise_for_status()
+                result = await response.json()
+                assert isinstance(result, dict)
+                token = self._token = result["token"]
+                # Python <3.11 doesn't understand the 'Z' suffix.
+                expires_at = result["expires_at"].replace("Z", "+00:00")
+                self._exp = datetime.fromisoformat(expires_at).timestamp()
+        return token
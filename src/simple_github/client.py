@@ -1,31 +1,271 @@
 import asyncio
 import json
+import os
+import threading
+import time
 from abc import abstractmethod
-from typing import TYPE_CHECKING, Any, Coroutine, Dict, Optional, Union
-
-from aiohttp import ClientResponse, ClientSession
+from functools import lru_cache
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Coroutine,
+    Dict,
+    Final,
+    MutableMapping,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+from aiohttp import ClientResponse, ClientSession, TCPConnector
 from gql import Client as GqlClient
 from gql import gql
-from gql.client import ReconnectingAsyncClientSession, SyncClientSession
+from gql.client import (
+    AsyncClientSession,
+    ReconnectingAsyncClientSession,
+    SyncClientSession,
+)
 from gql.transport.aiohttp import AIOHTTPTransport
 from gql.transport.requests import RequestsHTTPTransport
+from graphql import DocumentNode
+from multidict import CIMultiDict
 from requests import Response as RequestsResponse
 from requests import Session
 
+try:
+    import orjson  # pyright: ignore[reportMissingImports]
+except ImportError:
+    orjson = None
+
+try:
+    import uvloop  # pyright: ignore[reportMissingImports]
+except ImportError:
+    uvloop = None
+
 if TYPE_CHECKING:
     from simple_github.auth import Auth
 
-GITHUB_API_ENDPOINT = "https://api.github.com"
-GITHUB_GRAPHQL_ENDPOINT = "https://api.github.com/graphql"
+GITHUB_API_ENDPOINT: Final[str] = "https://api.github.com"
+GITHUB_GRAPHQL_ENDPOINT: Final[str] = "https://api.github.com/graphql"
+_ACCEPT = "application/vnd.github+json"
 
 Response = Union[RequestsResponse, ClientResponse]
 RequestData = Optional[Dict[str, Any]]
+Query = Union[str, DocumentNode]
 
 # Implementations of the base class can be either sync or async.
 BaseDict = Union[Dict[str, Any], Coroutine[None, None, Dict[str, Any]]]
 BaseNone = Union[None, Coroutine[None, None, None]]
 BaseResponse = Union[Response, Coroutine[None, None, Response]]
 
+T = TypeVar("T")
+
+
+# Connectors shared between all async clients in an event loop, so
+# connections to Github are re-used across clients. Maps the loop to the
+# connector and the number of clients using it. Entries for loops that were
+# closed without closing their clients are pruned when a connector is next
+# acquired. Those for loops discarded without being closed are never removed.
+_connectors: Dict[asyncio.AbstractEventLoop, Tuple[TCPConnector, int]] = {}
+
+
+def _prune_closed_loops(
+    registry: MutableMapping[asyncio.AbstractEventLoop, Any],
+) -> None:
+    """Remove the entries for closed event loops from `registry`.
+
+    Anything left behind for a closed loop can't be used or closed anymore.
+
+    Args:
+        registry (MutableMapping): A mapping keyed by event loop.
+    """
+    for loop in [loop for loop in registry if loop.is_closed()]:
+        del registry[loop]
+
+
+def _acquire_connector() -> TCPConnector:
+    """Return the connector shared by clients in the running event loop.
+
+    Returns:
+        aiohttp.TCPConnector: The shared connector.
+    """
+    _prune_closed_loops(_connectors)
+    loop = asyncio.get_running_loop()
+    if loop in _connectors:
+        connector, refs = _connectors[loop]
+    else:
+        # Github's addresses rarely change, so cache lookups for longer than
+        # aiohttp's default of 10 seconds.
+        connector = TCPConnector(limit=100, keepalive_timeout=75, ttl_dns_cache=300)
+        refs = 0
+    _connectors[loop] = (connector, refs + 1)
+    return connector
+
+
+async def _release_connector(connector: TCPConnector) -> None:
+    """Release a shared connector, closing it if it is no longer used.
+
+    Args:
+        connector (aiohttp.TCPConnector): The connector to release.
+    """
+    for loop, (shared, refs) in _connectors.items():
+        if shared is connector:
+            if refs > 1:
+                _connectors[loop] = (shared, refs - 1)
+            else:
+                del _connectors[loop]
+                await connector.close()
+            return
+
+
+class _SharedConnectorTransport(AIOHTTPTransport):
+    """An `AIOHTTPTransport` whose sessions use a connector it doesn't own.
+
+    The base transport doesn't close its session in that case, which would
+    leak a session each time a reconnecting GraphQL session reconnects.
+    Closing the session leaves the shared connector open.
+    """
+
+    async def close(self) -> None:
+        session = self.session
+        await super().close()
+        if session is not None:
+            await session.close()
+
+
+def _json_dumps(obj: Any) -> str:
+    """Serialize `obj` to JSON, using `orjson` if it is installed.
+
+    Objects `orjson` can't serialize but `json` can, such as integers wider
+    than 64 bits, fall back to `json`. The other differences between the two
+    are listed in the README.
+
+    Args:
+        obj (Any): The object to serialize.
+
+    Returns:
+        str: The serialized JSON.
+    """
+    if orjson is None:
+        return json.dumps(obj)
+    try:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+    except TypeError:
+        return json.dumps(obj)
+
+
+def _requests_json_kwargs(data: RequestData) -> Dict[str, Any]:
+    """Return the arguments for sending `data` as JSON with `requests`.
+
+    Unlike aiohttp, `requests` can't be given a custom serializer, so the body
+    is serialized here when `orjson` is installed.
+
+    Args:
+        data (Dict): The data to send (optional).
+
+    Returns:
+        Dict: Extra args to pass to `requests.Session.request`.
+    """
+    if data is None or orjson is None:
+        return {"json": data}
+    try:
+        body = orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    except TypeError:
+        # Let `requests` serialize whatever `orjson` can't.
+        return {"json": data}
+    return {"data": body, "headers": {"Content-Type": "application/json"}}
+
+
+@lru_cache(maxsize=256)
+def _parse(query: str) -> DocumentNode:
+    """Parse a GraphQL query, re-using the result for repeated queries.
+
+    Args:
+        query (str): The GraphQL query to parse.
+
+    Returns:
+        DocumentNode: The parsed query.
+    """
+    return gql(query)
+
+
+class _SyncLoopThread:
+    """An event loop running forever in a background thread.
+
+    `SyncClient` runs the auth's coroutines on this loop rather than creating
+    a new one for each call. This means anything the auth ties to a loop, such
+    as the client `AppInstallationAuth` uses to create tokens, keeps working
+    between calls.
+
+    If `uvloop` is installed, it is used for this loop. The event loop policy
+    isn't changed, so loops created by the application aren't affected.
+    """
+
+    _lock = threading.Lock()
+    _loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @classmethod
+    def get_loop(cls) -> asyncio.AbstractEventLoop:
+        """Return the loop, starting it if necessary.
+
+        Returns:
+            asyncio.AbstractEventLoop: The running event loop.
+        """
+        with cls._lock:
+            if cls._loop is None:
+                loop: asyncio.AbstractEventLoop
+                if uvloop is None:
+                    loop = asyncio.new_event_loop()
+                else:
+                    loop = uvloop.new_event_loop()
+                thread = threading.Thread(
+                    target=loop.run_forever, name="simple-github", daemon=True
+                )
+                thread.start()
+                cls._loop = loop
+            return cls._loop
+
+    @classmethod
+    def run(cls, coro: Coroutine[Any, Any, T]) -> T:
+        """Run a coroutine on the loop and wait for its result.
+
+        Args:
+            coro (Coroutine): The coroutine to run.
+
+        Returns:
+            The result of the coroutine.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, cls.get_loop()).result()
+
+    @classmethod
+    def _reset(cls) -> None:
+        """Forget the loop, so a new one is started when next needed.
+
+        Called in the child after a fork, where the loop's thread doesn't
+        exist and the lock may have been held by another thread.
+        """
+        cls._lock = threading.Lock()
+        cls._loop = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_SyncLoopThread._reset)
+
+
+def _set_authorization(headers: MutableMapping[str, str], token: str) -> None:
+    """Set the `Authorization` header for `token`, or remove it if there is
+    no token.
+
+    Args:
+        headers (MutableMapping): The headers to update.
+        token (str): The token to authenticate with.
+    """
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    else:
+        headers.pop("Authorization", None)
+
 
 class Client:
     def __init__(self, auth: "Auth"):
@@ -40,11 +280,27 @@ class Client:
         """
         self.auth = auth
         self._prev_token = None
+        # The `time.time()` timestamp until which the session can be returned
+        # without asking the auth for a token.
+        self._token_valid_until = 0.0
+        # Shared with the GraphQL transport, so updating it updates the
+        # transport's headers.
+        self._headers: MutableMapping[str, str] = {}
         self._gql_client: Optional[GqlClient] = None
         self._gql_session: Optional[
             Any[ReconnectingAsyncClientSession, SyncClientSession]
         ] = None
 
+        token = auth.sync_token()
+        if token is not None:
+            # The token never changes, so the GraphQL client can be built up
+            # front. Connecting is left to the first request.
+            self._build_gql_client(token)
+            self._prev_token = token
+
+    @abstractmethod
+    def _build_gql_client(self, token: str) -> None: ...
+
     @abstractmethod
     def close(self) -> BaseNone: ...
 
@@ -67,10 +323,17 @@ class Client:
     def delete(self, query: str, data: RequestData = None) -> BaseNone: ...
 
     @abstractmethod
-    def execute(self, query: str, variables: RequestData = None) -> BaseDict: ...
+    def execute(self, query: Query, variables: RequestData = None) -> BaseDict: ...
 
 
 class SyncClient(Client):
+    _gql_session: Optional[SyncClientSession]
+    # Set along with the GraphQL client.
+    _transport: RequestsHTTPTransport
+    # Set along with the GraphQL session, so the REST methods don't need to
+    # look it up through the transport.
+    _requests_session: Session
+
     def __enter__(self):
         return self
 
@@ -78,49 +341,85 @@ class SyncClient(Client):
         self.close()
 
     def close(self) -> None:
-        asyncio.run(self.auth.close())
-        if self._gql_client:
+        from simple_github.auth import Auth
+
+        # Most auths have nothing to close, so don't wait on the loop for them.
+        if type(self.auth).close is not Auth.close:
+            _SyncLoopThread.run(self.auth.close())
+        if self._gql_client and self._gql_session:
             self._gql_client.close_sync()
 
-    def _get_gql_session(self) -> SyncClientSession:
-        """Return an AIOHTTP session.
+    def _build_gql_client(self, token: str) -> None:
+        """Create a new GraphQL client authenticated with `token`, without
+        connecting it.
+
+        Args:
+            token (str): The token to authenticate with.
+        """
+        headers = {"Accept": _ACCEPT}
+        _set_authorization(headers, token)
+        self._headers = headers
+        self._transport = RequestsHTTPTransport(
+            url=GITHUB_GRAPHQL_ENDPOINT, headers=headers
+        )
+        self._gql_client = GqlClient(
+            transport=self._transport, fetch_schema_from_transport=False
+        )
 
-        The session will be automatically re-created anytime the auth's
-        token changes.
+    def _connect_gql_session(self) -> SyncClientSession:
+        """Connect the GraphQL client.
 
         Returns:
-            aiohttp.ClientSession: An AIOHTTP session object.
+            SyncClientSession: A GraphQL session object.
         """
-        token = asyncio.run(self.auth.get_token())
+        assert self._gql_client
+        session = self._gql_client.connect_sync()
+        assert isinstance(session, SyncClientSession)
 
-        if token == self._prev_token:
-            assert isinstance(self._gql_session, SyncClientSession)
+        # The transport only sends its headers with GraphQL queries, so also
+        # set them on the session used for REST requests.
+        assert self._transport.session
+        self._requests_session = self._transport.session
+        self._requests_session.headers.update(self._headers)
+        return session
+
+    def _get_gql_session(self) -> SyncClientSession:
+        """Return a GraphQL session.
+
+        The session's headers will be automatically updated anytime the
+        auth's token changes.
+
+        Returns:
+            SyncClientSession: A GraphQL session object.
+        """
+        if self._gql_session is not None and time.time() < self._token_valid_until:
             return self._gql_session
 
-        # Create a new session with updated token.
-        self._prev_token = token
-        if self._gql_client:
-            self._gql_client.close_sync()
+        token = self.auth.sync_token()
+        if token is None:
+            token = _SyncLoopThread.run(self.auth.get_token())
 
-        headers = {
-            "Accept": "application/vnd.github+json",
-        }
-        if token:
-            headers["Authorization"] = f"Bearer {token}"
+        if self._gql_client is None:
+            self._build_gql_client(token)
+        elif token != self._prev_token:
+            # Swap the token in place so the existing connections are re-used.
+            _set_authorization(self._headers, token)
+            if self._gql_session is not None:
+                _set_authorization(self._requests_session.headers, token)
 
-        transport = RequestsHTTPTransport(url=GITHUB_GRAPHQL_ENDPOINT, headers=headers)
-        self._gql_client = GqlClient(
-            transport=transport, fetch_schema_from_transport=False
-        )
-        self._gql_session = self._gql_client.connect_sync()
-        assert isinstance(self._gql_session, SyncClientSession)
+        if self._gql_session is None:
+            self._gql_session = self._connect_gql_session()
+
+        self._prev_token = token
+        expires_at = self.auth.expires_at
+        if expires_at is not None:
+            # Matches the margin the auths use before refreshing a token.
+            self._token_valid_until = expires_at - 60
         return self._gql_session
 
     def _get_requests_session(self) -> Session:
-        session = self._get_gql_session()
-        assert isinstance(session.transport, RequestsHTTPTransport)
-        assert session.transport.session
-        return session.transport.session
+        self._get_gql_session()
+        return self._requests_session
 
     def request(self, method: str, query: str, **kwargs) -> RequestsResponse:
         """Make a request to Github's REST API.
@@ -134,7 +433,10 @@ class SyncClient(Client):
         Returns:
             Dict: The JSON result of the request.
         """
-        url = f"{GITHUB_API_ENDPOINT}/{query.lstrip('/')}"
+        if query.startswith("/"):
+            url = GITHUB_API_ENDPOINT + query
+        else:
+            url = GITHUB_API_ENDPOINT + "/" + query
         session = self._get_requests_session()
 
         with session.request(method, url, **kwargs) as resp:
@@ -161,7 +463,7 @@ class SyncClient(Client):
         Returns:
             Dict: The JSON result of the request.
         """
-        return self.request("POST", query, data=json.dumps(data))
+        return self.request("POST", query, **_requests_json_kwargs(data))
 
     def put(self, query: str, data: RequestData = None) -> RequestsResponse:
         """Make a PUT request to Github's REST API.
@@ -173,7 +475,7 @@ class SyncClient(Client):
         Returns:
             Dict: The JSON result of the request.
         """
-        return self.request("PUT", query, data=json.dumps(data))
+        return self.request("PUT", query, **_requests_json_kwargs(data))
 
     def patch(self, query: str, data: RequestData = None) -> RequestsResponse:
         """Make a PATCH request to Github's REST API.
@@ -185,7 +487,7 @@ class SyncClient(Client):
         Returns:
             Dict: The JSON result of the request.
         """
-        return self.request("PATCH", query, data=json.dumps(data))
+        return self.request("PATCH", query, **_requests_json_kwargs(data))
 
     def delete(self, query: str, data: RequestData = None) -> None:
         """Make a DELETE request to Github's REST API.
@@ -194,24 +496,45 @@ class SyncClient(Client):
             query (str): The path segment of the request, e.g `/octocat`.
             data (Dict): The data to send in the request (optional).
         """
-        self.request("DELETE", query, data=json.dumps(data))
+        self.request("DELETE", query, **_requests_json_kwargs(data))
 
-    def execute(self, query: str, variables: RequestData = None) -> Dict[str, Any]:
+    def execute(self, query: Query, variables: RequestData = None) -> Dict[str, Any]:
         """Execute a query against Github's GraphQL endpoint.
 
         Args:
-            query (str): The GraphQL query to execute.
+            query (str or DocumentNode): The GraphQL query to execute, or a
+                document already parsed with `gql.gql`.
             variables (Dict): The GraphQL variables associated with the query
                 (optional).
 
         Returns:
             Dict: The result of the executed query.
         """
+        document = _parse(query) if isinstance(query, str) else query
         session = self._get_gql_session()
-        return session.execute(gql(query), variable_values=variables)
+        return session.execute(document, variable_values=variables)
 
 
 class AsyncClient(Client):
+    _gql_session: Optional[AsyncClientSession]
+    # Set along with the GraphQL client. Its aiohttp session is replaced if
+    # the GraphQL session reconnects, so that is always looked up from here.
+    _transport: _SharedConnectorTransport
+
+    def __init__(self, auth: "Auth", reconnecting: bool = True):
+        """An async Github client.
+
+        Args:
+            auth (Auth): An `Auth` instance for creating an authentication
+                token.
+            reconnecting (bool): Whether the GraphQL session reconnects
+                automatically if its connection fails (default: True).
+        """
+        super().__init__(auth)
+        self._reconnecting = reconnecting
+        self._connector: Optional[TCPConnector] = None
+        self._connect_lock: Optional[asyncio.Lock] = None
+
     async def __aenter__(self):
         return self
 
@@ -220,47 +543,100 @@ class AsyncClient(Client):
 
     async def close(self) -> None:
         await self.auth.close()
-        if self._gql_client:
+        if self._gql_client and self._gql_session:
             await self._gql_client.close_async()
+        if self._connector:
+            connector, self._connector = self._connector, None
+            await _release_connector(connector)
 
-    async def _get_gql_session(self) -> ReconnectingAsyncClientSession:
-        """Return an AIOHTTP session.
+    def _build_gql_client(self, token: str) -> None:
+        """Create a new GraphQL client authenticated with `token`, without
+        connecting it.
 
-        The session will be automatically re-created anytime the auth's
-        token changes.
+        Args:
+            token (str): The token to authenticate with.
+        """
+        # The session copies its default headers into a `CIMultiDict`, which is
+        # cheapest to do from another `CIMultiDict`.
+        headers: CIMultiDict[str] = CIMultiDict(Accept=_ACCEPT)
+        _set_authorization(headers, token)
+        self._headers = headers
+        self._transport = _SharedConnectorTransport(
+            url=GITHUB_GRAPHQL_ENDPOINT,
+            headers=headers,
+            # Also used by the session to serialize REST request bodies.
+            json_serialize=_json_dumps,
+        )
+        self._gql_client = GqlClient(
+            transport=self._transport, fetch_schema_from_transport=False
+        )
+
+    async def _connect_gql_session(self) -> AsyncClientSession:
+        """Connect the GraphQL client.
 
         Returns:
-            aiohttp.ClientSession: An AIOHTTP session object.
+            AsyncClientSession: A GraphQL session object, which is a
+                `ReconnectingAsyncClientSession` if the client reconnects.
         """
-        token = await self.auth.get_token()
-        if token == self._prev_token:
-            assert isinstance(self._gql_session, ReconnectingAsyncClientSession)
-            return self._gql_session
+        assert self._gql_client
+        # The connector belongs to the running loop, so it can only be acquired
+        # now. It is shared with other clients, so it mustn't be closed along
+        # with this client's session.
+        if self._connector is None:
+            self._connector = _acquire_connector()
+        self._transport.client_session_args = {
+            "connector": self._connector,
+            "connector_owner": False,
+        }
+        return await self._gql_client.connect_async(reconnecting=self._reconnecting)
 
-        # Create a new session with updated token.
-        self._prev_token = token
-        if self._gql_client:
-            await self._gql_client.close_async()
+    async def _get_gql_session(self) -> AsyncClientSession:
+        """Return a GraphQL session.
 
-        headers = {
-            "Accept": "application/vnd.github+json",
-        }
-        if token:
-            headers["Authorization"] = f"Bearer {token}"
+        The session's headers will be automatically updated anytime the
+        auth's token changes.
 
-        transport = AIOHTTPTransport(url=GITHUB_GRAPHQL_ENDPOINT, headers=headers)
-        self._gql_client = GqlClient(
-            transport=transport, fetch_schema_from_transport=False
-        )
-        self._gql_session = await self._gql_client.connect_async(reconnecting=True)
-        assert isinstance(self._gql_session, ReconnectingAsyncClientSession)
+        Returns:
+            AsyncClientSession: A GraphQL session object.
+        """
+        if self._gql_session is not None and time.time() < self._token_valid_until:
+            return self._gql_session
+
+        token = self.auth.sync_token()
+        if token is None:
+            token = await self.auth.get_token()
+
+        if self._gql_client is None:
+            self._build_gql_client(token)
+        elif token != self._prev_token:
+            # Swap the token in place so the existing connections are re-used.
+            # The transport's headers are used if it ever needs to reconnect.
+            _set_authorization(self._headers, token)
+            if self._transport.session:
+                _set_authorization(self._transport.session.headers, token)
+
+        if self._gql_session is None:
+            # The GraphQL client can only be connected once. Only let a single
+            # task connect it, the others wait and re-use the session.
+            if self._connect_lock is None:
+                self._connect_lock = asyncio.Lock()
+
+            async with self._connect_lock:
+                if self._gql_session is None:
+                    self._gql_session = await self._connect_gql_session()
+
+        self._prev_token = token
+        expires_at = self.auth.expires_at
+        if expires_at is not None:
+            # Matches the margin the auths use before refreshing a token.
+            self._token_valid_until = expires_at - 60
         return self._gql_session
 
     async def _get_aiohttp_session(self) -> ClientSession:
-        session = await self._get_gql_session()
-        assert isinstance(session.transport, AIOHTTPTransport)
-        assert session.transport.session
-        return session.transport.session
+        await self._get_gql_session()
+        session = self._transport.session
+        assert session
+        return session
 
     async def request(self, method: str, query: str, **kwargs: Any) -> ClientResponse:
         """Make a request to Github's REST API.
@@ -274,7 +650,10 @@ class AsyncClient(Client):
         Returns:
             Dict: The JSON result of the request.
         """
-        url = f"{GITHUB_API_ENDPOINT}/{query.lstrip('/')}"
+        if query.startswith("/"):
+            url = GITHUB_API_ENDPOINT + query
+        else:
+            url = GITHUB_API_ENDPOINT + "/" + query
         session = await self._get_aiohttp_session()
         return await session.request(method, url, **kwargs)
 
@@ -299,7 +678,7 @@ class AsyncClient(Client):
         Returns:
             Dict: The JSON result of the request.
         """
-        return await self.request("POST", query, data=json.dumps(data))
+        return await self.request("POST", query, json=data)
 
     async def put(self, query: str, data: RequestData = None) -> ClientResponse:
         """Make a PUT request to Github's REST API.
@@ -311,7 +690,7 @@ class AsyncClient(Client):
         Returns:
             Dict: The JSON result of the request.
         """
-        return await self.request("PUT", query, data=json.dumps(data))
+        return await self.request("PUT", query, json=data)
 
     async def patch(self, query: str, data: RequestData = None) -> ClientResponse:
         """Make a PATCH request to Github's REST API.
@@ -323,7 +702,7 @@ class AsyncClient(Client):
         Returns:
             Dict: The JSON result of the request.
         """
-        return await self.request("PATCH", query, data=json.dumps(data))
+        return await self.request("PATCH", query, json=data)
 
     async def delete(self, query: str, data: RequestData = None) -> None:
         """Make a DELETE request to Github's REST API.
@@ -332,20 +711,22 @@ class AsyncClient(Client):
             query (str): The path segment of the request, e.g `/octocat`.
             data (Dict): The data to send in the request (optional).
         """
-        await self.request("DELETE", query, data=json.dumps(data))
+        await self.request("DELETE", query, json=data)
 
     async def execute(
-        self, query: str, variables: RequestData = None
+        self, query: Query, variables: RequestData = None
     ) -> Dict[str, Any]:
         """Execute a query against Github's GraphQL endpoint.
 
         Args:
-            query (str): The GraphQL query to execute.
+            query (str or DocumentNode): The GraphQL query to execute, or a
+                document already parsed with `gql.gql`.
             variables (Dict): The GraphQL variables associated with the query
                 (optional).
 
         Returns:
             Dict: The result of the executed query.
         """
+        document = _parse(query) if isinstance(query, str) else query
         session = await self._get_gql_session()
-        return await session.execute(gql(query), variable_values=variables)
+        return await session.execute(document, variable_values=variables)
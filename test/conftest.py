@@ -1,11 +1,25 @@
+import asyncio
 from pathlib import Path
 
 import pytest
 from responses import RequestsMock
 
+try:
+    import uvloop  # pyright: ignore[reportMissingImports]
+except ImportError:
+    uvloop = None
+
 here = Path(__file__).parent
 
 
+@pytest.fixture(scope="session")
+def event_loop_policy():
+    """Run the async tests on `uvloop` if it is installed."""
+    if uvloop is None:
+        return asyncio.get_event_loop_policy()
+    return uvloop.EventLoopPolicy()
+
+
 @pytest.fixture
 def responses():
     with RequestsMock() as rsps:
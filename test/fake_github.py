@@ -0,0 +1,62 @@
+"""A minimal in-process stand-in for the Github API.
+
+Tests using it go through a real `aiohttp` session and connector, rather
+than having `aioresponses` patch out the request.
+"""
+
+from typing import List, Optional, Tuple
+
+from aiohttp import web
+
+INSTALLATION_ID = 1
+INSTALLATION_TOKEN = "789"
+
+routes = web.RouteTableDef()
+
+
+@routes.get("/octocat")
+async def octocat(request: web.Request) -> web.Response:
+    return web.json_response({"foo": "bar"})
+
+
+@routes.get("/users/{owner}/installation")
+async def installation(request: web.Request) -> web.Response:
+    owner = request.match_info["owner"]
+    return web.json_response({"id": INSTALLATION_ID, "account": {"login": owner}})
+
+
+@routes.post("/app/installations/{id}/access_tokens")
+async def access_tokens(request: web.Request) -> web.Response:
+    if request.match_info["id"] != str(INSTALLATION_ID):
+        raise web.HTTPNotFound()
+    return web.json_response(
+        {"token": INSTALLATION_TOKEN, "expires_at": "2100-01-01T00:00:00Z"}
+    )
+
+
+@routes.post("/graphql")
+async def graphql(request: web.Request) -> web.Response:
+    return web.json_response({"data": {"viewer": {"login": "octocat"}}})
+
+
+def make_app(requests: List[Tuple[str, str, Optional[str]]]) -> web.Application:
+    """Create the fake Github application.
+
+    Args:
+        requests (List): Appended with the method, path and `Authorization`
+            header of every request made to the application.
+
+    Returns:
+        aiohttp.web.Application: The application.
+    """
+
+    @web.middleware
+    async def record(request: web.Request, handler) -> web.StreamResponse:
+        requests.append(
+            (request.method, request.path, request.headers.get("Authorization"))
+        )
+        return await handler(request)
+
+    app = web.Application(middlewares=[record])
+    app.add_routes(routes)
+    return app
@@ -1,17 +1,54 @@
+import asyncio
 import time
+from datetime import datetime, timezone
 from unittest import mock
 
 import jwt
 import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from yarl import URL
 
-from simple_github.auth import AppAuth, AppInstallationAuth, PublicAuth, TokenAuth
-from simple_github.client import GITHUB_API_ENDPOINT
+from simple_github import auth as auth_mod
+from simple_github.auth import (
+    AppAuth,
+    AppInstallationAuth,
+    Auth,
+    PublicAuth,
+    TokenAuth,
+)
+from simple_github.client import GITHUB_API_ENDPOINT, _SyncLoopThread
+
+
+@pytest.mark.parametrize(
+    "make_auth",
+    (
+        pytest.param(lambda privkey: PublicAuth(), id="public"),
+        pytest.param(lambda privkey: TokenAuth("123"), id="token"),
+        pytest.param(lambda privkey: AppAuth(42, privkey), id="app"),
+        pytest.param(
+            lambda privkey: AppInstallationAuth(AppAuth(42, privkey), "mozilla"),
+            id="app installation",
+        ),
+    ),
+)
+def test_auth_slots(make_auth, privkey):
+    auth = make_auth(privkey)
+    assert not hasattr(auth, "__dict__")
+
+
+@pytest.mark.asyncio
+async def test_auth_get_token():
+    with pytest.raises(NotImplementedError):
+        await Auth().get_token()
+    assert Auth().expires_at is None
 
 
 @pytest.mark.asyncio
 async def test_public_auth_get_token():
     auth = PublicAuth()
     assert await auth.get_token() == ""
+    assert auth.sync_token() == ""
 
 
 @pytest.mark.asyncio
@@ -19,17 +56,21 @@ async def test_token_auth_get_token():
     token = "123"
     auth = TokenAuth(token)
     assert await auth.get_token() == token
+    assert auth.sync_token() == token
 
 
 @pytest.mark.asyncio
 async def test_app_auth_get_token(privkey, pubkey):
     id = 42
     auth = AppAuth(id, privkey)
+    assert auth.sync_token() is None
     token = await auth.get_token()
 
+    assert jwt.get_unverified_header(token) == {"alg": "RS256", "typ": "JWT"}
     payload = jwt.decode(token, pubkey, algorithms=["RS256"])
     assert payload["iss"] == id
     assert payload["exp"] == payload["iat"] + 540
+    assert auth.expires_at == payload["exp"]
 
     # Calling again yields the same token
     assert await auth.get_token() == token
@@ -39,9 +80,43 @@ async def test_app_auth_get_token(privkey, pubkey):
         new_token = await auth.get_token()
         assert new_token == token
 
-    with mock.patch.object(time, "time", return_value=payload["exp"] - 59):
+    # Github checks `exp` on the wall clock, so a suspend that only advances
+    # the system clock still expires the token.
+    with mock.patch.object(
+        time, "time", return_value=payload["exp"] - 59
+    ), mock.patch.object(time, "monotonic", return_value=time.monotonic()):
         new_token = await auth.get_token()
         assert new_token != token
+    assert jwt.decode(new_token, options={"verify_signature": False})["iat"] == (
+        payload["exp"] - 59
+    )
+
+
+def test_app_auth_encode_jwt(privkey):
+    auth = AppAuth(42, privkey)
+    payload = {"iat": 1000, "exp": 1540, "iss": 42}
+    assert auth._encode_jwt(1000) == jwt.encode(payload, privkey, algorithm="RS256")
+
+
+@pytest.mark.asyncio
+async def test_app_auth_get_token_concurrent(privkey):
+    auth = AppAuth(42, privkey)
+    with mock.patch.object(
+        AppAuth, "_encode_jwt", autospec=True, side_effect=AppAuth._encode_jwt
+    ) as m_encode:
+        tokens = await asyncio.gather(*[auth.get_token() for _ in range(5)])
+    assert len(set(tokens)) == 1
+    assert m_encode.call_count == 1
+
+
+def test_app_auth_requires_rsa_key():
+    privkey = ec.generate_private_key(ec.SECP256R1()).private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    with pytest.raises(ValueError):
+        AppAuth(42, privkey)
 
 
 @pytest.mark.asyncio
@@ -50,19 +125,24 @@ async def test_app_installation_auth_get_token(aioresponses, privkey):
     inst_id = 100
     owner = "mozilla"
     auth = AppInstallationAuth(app=AppAuth(app_id, privkey), owner=owner)
+    exp = int(time.time()) + 3600
+    expires_at = datetime.fromtimestamp(exp, timezone.utc).strftime(
+        "%Y-%m-%dT%H:%M:%SZ"
+    )
 
     aioresponses.get(
-        f"{GITHUB_API_ENDPOINT}/app/installations",
+        f"{GITHUB_API_ENDPOINT}/users/{owner}/installation",
         status=200,
-        payload=[{"id": inst_id, "account": {"login": owner}}],
+        payload={"id": inst_id, "account": {"login": owner}},
     )
     aioresponses.post(
         f"{GITHUB_API_ENDPOINT}/app/installations/{inst_id}/access_tokens",
         status=200,
-        payload={"token": "111"},
+        payload={"token": "111", "expires_at": expires_at},
     )
     token = await auth.get_token()
     assert token == "111"
+    assert auth.expires_at == exp
 
     # Calling again yields the same token
     assert await auth.get_token() == token
@@ -71,13 +151,171 @@ async def test_app_installation_auth_get_token(aioresponses, privkey):
     aioresponses.post(
         f"{GITHUB_API_ENDPOINT}/app/installations/{inst_id}/access_tokens",
         status=200,
-        payload={"token": "222"},
+        payload={"token": "222", "expires_at": expires_at},
     )
-    cur = int(time.time())
-    with mock.patch.object(time, "time", return_value=cur + 3600 - 61):
+    with mock.patch.object(time, "time", return_value=exp - 61):
         new_token = await auth.get_token()
         assert new_token == token
 
-    with mock.patch.object(time, "time", return_value=cur + 3600 - 59):
+    # Github's expiry is wall-clock time, so a suspend that only advances the
+    # system clock still expires the token.
+    with mock.patch.object(time, "time", return_value=exp - 59), mock.patch.object(
+        time, "monotonic", return_value=time.monotonic()
+    ):
         new_token = await auth.get_token()
         assert new_token != token
+
+    # The installation id is only looked up once
+    key = ("GET", URL(f"{GITHUB_API_ENDPOINT}/users/{owner}/installation"))
+    assert len(aioresponses.requests[key]) == 1
+    await auth.close()
+
+
+@pytest.mark.parametrize(
+    "repositories,expected",
+    (
+        pytest.param(None, {}, id="none"),
+        pytest.param("foo", {"repositories": ["foo"]}, id="str"),
+        pytest.param(["foo", "bar"], {"repositories": ["foo", "bar"]}, id="list"),
+    ),
+)
+def test_app_installation_auth_data(privkey, repositories, expected):
+    auth = AppInstallationAuth(
+        app=AppAuth(42, privkey), owner="mozilla", repositories=repositories
+    )
+    assert auth._data == expected
+
+
+@pytest.mark.asyncio
+async def test_app_installation_auth_get_installation_id_org(aioresponses, privkey):
+    owner = "mozilla"
+    auth = AppInstallationAuth(app=AppAuth(42, privkey), owner=owner)
+
+    aioresponses.get(f"{GITHUB_API_ENDPOINT}/users/{owner}/installation", status=404)
+    aioresponses.get(
+        f"{GITHUB_API_ENDPOINT}/orgs/{owner}/installation",
+        status=200,
+        payload={"id": 100, "account": {"login": owner}},
+    )
+    assert await auth._get_installation_id() == 100
+    await auth.close()
+
+
+@pytest.mark.asyncio
+async def test_app_installation_auth_get_installation_id_missing(aioresponses, privkey):
+    owner = "mozilla"
+    auth = AppInstallationAuth(app=AppAuth(42, privkey), owner=owner)
+
+    aioresponses.get(f"{GITHUB_API_ENDPOINT}/users/{owner}/installation", status=404)
+    aioresponses.get(f"{GITHUB_API_ENDPOINT}/orgs/{owner}/installation", status=404)
+    with pytest.raises(Exception, match="is not installed with owner"):
+        await auth._get_installation_id()
+    await auth.close()
+
+
+@pytest.mark.asyncio
+async def test_app_installation_auth_get_token_concurrent(aioresponses, privkey):
+    inst_id = 100
+    owner = "mozilla"
+    auth = AppInstallationAuth(app=AppAuth(42, privkey), owner=owner)
+
+    # Each route is only registered once, so a second request would fail.
+    aioresponses.get(
+        f"{GITHUB_API_ENDPOINT}/users/{owner}/installation",
+        status=200,
+        payload={"id": inst_id, "account": {"login": owner}},
+    )
+    aioresponses.post(
+        f"{GITHUB_API_ENDPOINT}/app/installations/{inst_id}/access_tokens",
+        status=200,
+        payload={"token": "111", "expires_at": "2100-01-01T00:00:00Z"},
+    )
+    tokens = await asyncio.gather(*[auth.get_token() for _ in range(5)])
+    assert tokens == ["111"] * 5
+    await auth.close()
+
+
+@pytest.mark.asyncio
+async def test_app_installation_auth_shared_client(privkey):
+    app = AppAuth(1000, privkey)
+    auth1 = AppInstallationAuth(app=app, owner="mozilla")
+    auth2 = AppInstallationAuth(app=AppAuth(1000, privkey), owner="mozilla-releng")
+    other = AppInstallationAuth(app=AppAuth(1001, privkey), owner="mozilla")
+    key = (1000, app._privkey.public_key().public_numbers())
+
+    # Nothing is acquired until the client is needed.
+    assert auth1._client is None
+    assert asyncio.get_running_loop() not in auth_mod._app_clients
+
+    client = auth1._get_client()
+    assert auth2._get_client() is client
+    assert other._get_client() is not client
+    clients = auth_mod._app_clients[asyncio.get_running_loop()]
+    assert clients[key] == (client, 2)
+
+    # The client stays alive until the last installation is closed.
+    await auth1.close()
+    await auth1.close()
+    assert clients[key] == (client, 1)
+
+    await auth2.close()
+    assert key not in clients
+
+    await other.close()
+    assert asyncio.get_running_loop() not in auth_mod._app_clients
+
+
+@pytest.mark.asyncio
+async def test_app_installation_auth_client_different_key(privkey):
+    other_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    other_privkey = other_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    auth1 = AppInstallationAuth(app=AppAuth(1000, privkey), owner="mozilla")
+    auth2 = AppInstallationAuth(app=AppAuth(1000, other_privkey), owner="mozilla")
+
+    client = auth1._get_client()
+    assert auth2._get_client() is not client
+    assert client.auth is auth1.app
+    await auth1.close()
+    await auth2.close()
+
+
+def test_app_installation_auth_client_per_loop(privkey):
+    app = AppAuth(1000, privkey)
+
+    async def get_client(auth):
+        return auth._get_client()
+
+    loops = []
+
+    def run(coro):
+        # Not `asyncio.run`, which trips up pytest-asyncio's own loop handling.
+        loop = asyncio.new_event_loop()
+        loops.append(loop)
+        try:
+            return loop.run_until_complete(coro)
+        finally:
+            loop.close()
+
+    # An installation left open in a loop that has since closed.
+    auth1 = AppInstallationAuth(app=app, owner="mozilla")
+    client1 = run(get_client(auth1))
+
+    auth2 = AppInstallationAuth(app=app, owner="mozilla")
+    client2 = run(get_client(auth2))
+    assert client2 is not client1
+    # The first loop is pruned once a client is acquired in another loop.
+    assert loops[0] not in auth_mod._app_clients
+
+    # An installation used by a `SyncClient` runs on its background loop.
+    sync_loop = _SyncLoopThread.get_loop()
+    auth3 = AppInstallationAuth(app=app, owner="mozilla")
+    client3 = _SyncLoopThread.run(get_client(auth3))
+    assert client3 is not client2
+    assert sync_loop in auth_mod._app_clients
+    assert not any(loop.is_closed() for loop in auth_mod._app_clients)
+    _SyncLoopThread.run(auth3.close())
+    assert sync_loop not in auth_mod._app_clients
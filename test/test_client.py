@@ -1,11 +1,25 @@
+import asyncio
+import json
+import os
+import signal
+import time
+from datetime import date
+
 import pytest
 import pytest_asyncio
 from aiohttp import ClientResponseError
 from gql import Client as GqlClient
-from gql.client import ReconnectingAsyncClientSession, SyncClientSession
+from gql import gql
+from gql.client import (
+    AsyncClientSession,
+    ReconnectingAsyncClientSession,
+    SyncClientSession,
+)
+from multidict import CIMultiDict
 from requests.exceptions import HTTPError
 
-from simple_github.auth import TokenAuth
+from simple_github import client as client_mod
+from simple_github.auth import Auth, TokenAuth
 from simple_github.client import (
     GITHUB_API_ENDPOINT,
     GITHUB_GRAPHQL_ENDPOINT,
@@ -13,10 +27,57 @@ from simple_github.client import (
     SyncClient,
 )
 
+_VIEWER_QUERY = "query { viewer { login }}"
+# Parsed once for the tests that don't need to cover parsing.
+_VIEWER_DOCUMENT = gql(_VIEWER_QUERY)
+
+
+class LoopAuth(Auth):
+    """Records the event loops its coroutines are run on."""
+
+    __slots__ = ("loops",)
+
+    def __init__(self):
+        self.loops = []
+
+    async def get_token(self) -> str:
+        self.loops.append(asyncio.get_running_loop())
+        return "abc"
+
+    async def close(self) -> None:
+        self.loops.append(asyncio.get_running_loop())
+
+
+class ExpiringAuth(LoopAuth):
+    """A `LoopAuth` whose tokens expire at `exp`."""
+
+    __slots__ = ("exp",)
+
+    def __init__(self, exp: float):
+        super().__init__()
+        self.exp = exp
+
+    @property
+    def expires_at(self) -> float:
+        return self.exp
+
 
 @pytest_asyncio.fixture
 async def async_client():
-    client = AsyncClient(auth=TokenAuth("abc"))
+    # Reconnecting isn't needed against mocked responses.
+    client = AsyncClient(auth=TokenAuth("abc"), reconnecting=False)
+    yield client
+    await client.close()
+
+
+@pytest_asyncio.fixture(scope="module")
+async def shared_async_client():
+    """An `AsyncClient` shared by the tests in this module that don't modify
+    it, so its session is only created once. Tests using it must run in the
+    module's event loop with `@pytest.mark.asyncio(scope="module")`.
+    """
+    # Reconnecting isn't needed against mocked responses.
+    client = AsyncClient(auth=TokenAuth("abc"), reconnecting=False)
     yield client
     await client.close()
 
@@ -31,14 +92,19 @@ def sync_client():
 @pytest.mark.asyncio
 async def test_async_client_get_session(async_client):
     client = async_client
-    assert client._gql_client is None
+    # The token never changes, so the GraphQL client is built up front
+    assert isinstance(client._gql_client, GqlClient)
     assert client._gql_session is None
+    assert client._connector is None
 
     session = await client._get_aiohttp_session()
     assert isinstance(client._gql_client, GqlClient)
-    assert isinstance(client._gql_session, ReconnectingAsyncClientSession)
+    assert type(client._gql_session) is AsyncClientSession
 
     assert client._gql_session.transport.session == session
+    assert session.connector is client._connector
+    assert session._json_serialize is client_mod._json_dumps
+    assert isinstance(client._gql_session.transport.headers, CIMultiDict)
     assert dict(session._default_headers) == {
         "Accept": "application/vnd.github+json",
         "Authorization": f"Bearer {client.auth._token}",
@@ -47,16 +113,104 @@ async def test_async_client_get_session(async_client):
     # Calling get_session again returns the same session
     assert await client._get_aiohttp_session() == session
 
-    # Unless the token has changed
+
+@pytest.mark.asyncio
+async def test_async_client_get_session_token_changed(async_client):
+    client = async_client
+    session = await client._get_aiohttp_session()
+    gql_client = client._gql_client
+
+    # When the token has changed, only the headers are updated
     client.auth._token = "def"
-    new_session = await client._get_aiohttp_session()
-    assert new_session != session
-    assert session.closed
-    assert dict(new_session._default_headers) == {
+    assert await client._get_aiohttp_session() == session
+    assert client._gql_client is gql_client
+    assert not session.closed
+    assert dict(session._default_headers) == {
+        "Accept": "application/vnd.github+json",
+        "Authorization": f"Bearer {client.auth._token}",
+    }
+    assert dict(client._gql_session.transport.headers) == {
         "Accept": "application/vnd.github+json",
         "Authorization": f"Bearer {client.auth._token}",
     }
 
+    # Including when the token is removed
+    client.auth._token = ""
+    assert await client._get_aiohttp_session() == session
+    assert dict(session._default_headers) == {
+        "Accept": "application/vnd.github+json",
+    }
+
+
+@pytest.mark.asyncio
+async def test_async_client_get_session_reconnecting():
+    async with AsyncClient(auth=TokenAuth("abc")) as client:
+        await client._get_gql_session()
+        assert isinstance(client._gql_session, ReconnectingAsyncClientSession)
+
+
+@pytest.mark.asyncio
+async def test_async_client_shared_connector():
+    client1 = AsyncClient(auth=TokenAuth("abc"))
+    client2 = AsyncClient(auth=TokenAuth("def"))
+
+    session1 = await client1._get_aiohttp_session()
+    session2 = await client2._get_aiohttp_session()
+    assert session1 is not session2
+    connector = session1.connector
+    assert connector is session2.connector
+
+    # The connector stays open until the last client using it is closed.
+    await client1.close()
+    assert session1.closed
+    assert not connector.closed
+
+    await client2.close()
+    assert connector.closed
+    assert asyncio.get_running_loop() not in client_mod._connectors
+
+
+@pytest.mark.asyncio
+async def test_async_client_reconnect_closes_session():
+    async with AsyncClient(auth=TokenAuth("abc")) as client:
+        session = await client._get_aiohttp_session()
+        connector = session.connector
+
+        # What the reconnecting GraphQL session does when its connection fails.
+        await client._transport.close()
+        await client._transport.connect()
+
+        new_session = await client._get_aiohttp_session()
+        assert new_session is not session
+        assert session.closed
+        # The shared connector is still in use by the new session.
+        assert new_session.connector is connector
+        assert not connector.closed
+    assert new_session.closed
+    assert connector.closed
+
+
+def test_async_client_connectors_closed_loop():
+    async def acquire():
+        return client_mod._acquire_connector()
+
+    # A client that is never closed leaves its loop's connector registered.
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(acquire())
+    loop.close()
+    assert loop in client_mod._connectors
+
+    # It can't be used anymore, so it is dropped when a connector is next
+    # acquired.
+    other = asyncio.new_event_loop()
+    try:
+        connector = other.run_until_complete(acquire())
+        assert loop not in client_mod._connectors
+        other.run_until_complete(client_mod._release_connector(connector))
+        assert other not in client_mod._connectors
+    finally:
+        other.close()
+
 
 @pytest.mark.asyncio
 async def test_async_client_get_session_no_token(async_client):
@@ -70,31 +224,140 @@ async def test_async_client_get_session_no_token(async_client):
 
 def test_sync_client_get_session(sync_client):
     client = sync_client
-    assert client._gql_client is None
+    assert isinstance(client._gql_client, GqlClient)
     assert client._gql_session is None
 
     session = client._get_requests_session()
     assert isinstance(client._gql_client, GqlClient)
-    print(client._gql_session)
     assert isinstance(client._gql_session, SyncClientSession)
 
     assert client._gql_session.transport.session == session
-    assert dict(client._gql_session.transport.headers) == {
+    expected = {
         "Accept": "application/vnd.github+json",
         "Authorization": f"Bearer {client.auth._token}",
     }
+    assert dict(client._gql_session.transport.headers) == expected
+    assert session.headers["Accept"] == expected["Accept"]
+    assert session.headers["Authorization"] == expected["Authorization"]
 
     # Calling get_session again returns the same session
     assert client._get_requests_session() == session
 
-    # Unless the token has changed
+
+def test_sync_client_get_session_token_changed(sync_client):
+    client = sync_client
+    session = client._get_requests_session()
+    gql_client = client._gql_client
+
+    # When the token has changed, only the headers are updated
     client.auth._token = "def"
-    new_session = client._get_requests_session()
-    assert new_session != session
+    assert client._get_requests_session() == session
+    assert client._gql_client is gql_client
     assert dict(client._gql_session.transport.headers) == {
         "Accept": "application/vnd.github+json",
-        "Authorization": f"Bearer {client.auth._token}",
+        "Authorization": "Bearer def",
     }
+    assert session.headers["Authorization"] == "Bearer def"
+
+    # Including when the token is removed
+    client.auth._token = ""
+    assert client._get_requests_session() == session
+    assert dict(client._gql_session.transport.headers) == {
+        "Accept": "application/vnd.github+json",
+    }
+    assert "Authorization" not in session.headers
+
+
+def test_sync_client_get_session_builds_lazily():
+    # The token may change, so the GraphQL client isn't built up front
+    client = SyncClient(auth=LoopAuth())
+    assert client._gql_client is None
+    client._get_requests_session()
+    assert isinstance(client._gql_client, GqlClient)
+    client.close()
+
+
+@pytest.mark.asyncio
+async def test_async_client_close_unconnected():
+    await AsyncClient(auth=TokenAuth("abc")).close()
+
+
+def test_sync_client_close_unconnected():
+    SyncClient(auth=TokenAuth("abc")).close()
+
+
+def test_sync_client_get_token_shared_loop():
+    auth = LoopAuth()
+    client = SyncClient(auth=auth)
+    client._get_requests_session()
+    client._get_requests_session()
+    client.close()
+
+    # The auth is also closed on the loop its tokens were created on
+    assert len(auth.loops) == 3
+    assert auth.loops[0] is auth.loops[1] is auth.loops[2]
+    assert auth.loops[0] is client_mod._SyncLoopThread.get_loop()
+    assert auth.loops[0].is_running()
+
+
+def test_sync_client_close_no_op_auth(mocker):
+    run = mocker.patch.object(client_mod._SyncLoopThread, "run")
+    SyncClient(auth=TokenAuth("abc")).close()
+    run.assert_not_called()
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+# Forking with the loop's thread running is the point of the test.
+@pytest.mark.filterwarnings("ignore:This process .* is multi-threaded")
+def test_sync_loop_thread_after_fork():
+    parent_loop = client_mod._SyncLoopThread.get_loop()
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            # Kills the child if the loop's thread never runs the coroutine.
+            signal.alarm(5)
+            loop = client_mod._SyncLoopThread.get_loop()
+            result = client_mod._SyncLoopThread.run(asyncio.sleep(0, "done"))
+            if loop is not parent_loop and result == "done":
+                code = 0
+        finally:
+            os._exit(code)
+
+    _, status = os.waitpid(pid, 0)
+    assert os.WIFEXITED(status)
+    assert os.WEXITSTATUS(status) == 0
+
+
+@pytest.mark.asyncio
+async def test_async_client_get_session_token_valid(mocker):
+    mock_time = mocker.patch.object(client_mod, "time")
+    mock_time.time.return_value = 900.0
+    auth = ExpiringAuth(1000.0)
+    async with AsyncClient(auth=auth) as client:
+        session = await client._get_gql_session()
+        assert client._token_valid_until == 940.0
+        # The token is still valid, so the auth isn't asked for it again
+        assert await client._get_gql_session() is session
+        assert len(auth.loops) == 1
+
+        mock_time.time.return_value = 950.0
+        assert await client._get_gql_session() is session
+        assert len(auth.loops) == 2
+
+
+def test_sync_client_get_session_token_valid(mocker):
+    mock_time = mocker.patch.object(client_mod, "time")
+    mock_time.time.return_value = 900.0
+    auth = ExpiringAuth(1000.0)
+    with SyncClient(auth=auth) as client:
+        session = client._get_gql_session()
+        assert client._get_gql_session() is session
+        assert len(auth.loops) == 1
+
+        mock_time.time.return_value = 950.0
+        assert client._get_gql_session() is session
+        assert len(auth.loops) == 2
 
 
 def test_sync_client_get_session_no_token(sync_client):
@@ -106,81 +369,111 @@ def test_sync_client_get_session_no_token(sync_client):
     }
 
 
-@pytest.mark.asyncio
-async def test_async_client_rest(aioresponses, async_client):
-    client = async_client
+REST_CASES = (
+    pytest.param("get", {}, id="get"),
+    pytest.param("post", {"data": {"foo": "bar"}}, id="post"),
+    pytest.param("put", {"data": {"foo": "bar"}}, id="put"),
+    pytest.param("patch", {"data": {"foo": "bar"}}, id="patch"),
+)
+
+
+@pytest.mark.asyncio(scope="module")
+@pytest.mark.parametrize("method,kwargs", REST_CASES)
+async def test_async_client_rest(aioresponses, shared_async_client, method, kwargs):
+    client = shared_async_client
     url = f"{GITHUB_API_ENDPOINT}/octocat"
 
-    aioresponses.get(url, status=200, payload={"answer": 42})
-    resp = await client.get("/octocat")
+    aioresponses.add(url, method.upper(), status=200, payload={"answer": 42})
+    resp = await getattr(client, method)("/octocat", **kwargs)
     result = await resp.json()
     assert result == {"answer": 42}
+    if "data" in kwargs:
+        aioresponses.assert_called_with(url, method.upper(), json=kwargs["data"])
 
-    aioresponses.post(url, status=200, payload={"answer": 42})
-    resp = await client.post("/octocat", data={"foo": "bar"})
-    result = await resp.json()
-    assert result == {"answer": 42}
 
-    aioresponses.put(url, status=200, payload={"answer": 42})
-    resp = await client.put("/octocat", data={"foo": "bar"})
-    result = await resp.json()
-    assert result == {"answer": 42}
+@pytest.mark.asyncio(scope="module")
+@pytest.mark.parametrize("query", ("/octocat", "octocat"))
+async def test_async_client_rest_url(aioresponses, shared_async_client, query):
+    url = f"{GITHUB_API_ENDPOINT}/octocat"
+    aioresponses.get(url, status=200, payload={"answer": 42})
+    resp = await shared_async_client.get(query)
+    assert str(resp.url) == url
+
+
+@pytest.mark.asyncio
+async def test_async_client_rest_concurrent_first_requests(aioresponses):
+    url = f"{GITHUB_API_ENDPOINT}/octocat"
+    aioresponses.get(url, status=200, payload={"answer": 42}, repeat=True)
+    # Reconnecting sessions wait for their connection, unlike the fixture's.
+    async with AsyncClient(auth=TokenAuth("abc")) as client:
+        responses = await asyncio.wait_for(
+            asyncio.gather(*[client.get("/octocat") for _ in range(3)]), timeout=5
+        )
+    assert [resp.status for resp in responses] == [200] * 3
 
-    aioresponses.patch(url, status=200, payload={"answer": 42})
-    resp = await client.patch("/octocat", data={"foo": "bar"})
-    result = await resp.json()
-    assert result == {"answer": 42}
 
+@pytest.mark.asyncio(scope="module")
+async def test_async_client_rest_delete(aioresponses, shared_async_client):
+    url = f"{GITHUB_API_ENDPOINT}/octocat"
     aioresponses.delete(url, status=200)
-    await client.delete("/octocat")
-    aioresponses.assert_called_with(url, "DELETE", data="null")
+    assert await shared_async_client.delete("/octocat") is None
+    aioresponses.assert_called_with(url, "DELETE", json=None)
+
 
-    aioresponses.get(url, status=401)
+@pytest.mark.asyncio(scope="module")
+async def test_async_client_rest_error(aioresponses, shared_async_client):
+    aioresponses.get(f"{GITHUB_API_ENDPOINT}/octocat", status=401)
     with pytest.raises(ClientResponseError):
-        resp = await client.get("/octocat")
+        resp = await shared_async_client.get("/octocat")
         resp.raise_for_status()
 
 
-def test_sync_client_rest(responses, sync_client):
+@pytest.mark.parametrize("method,kwargs", REST_CASES)
+def test_sync_client_rest(responses, sync_client, method, kwargs):
     client = sync_client
     url = f"{GITHUB_API_ENDPOINT}/octocat"
 
-    responses.get(url, status=200, json={"answer": 42})
-    resp = client.get("/octocat")
+    responses.add(method.upper(), url, status=200, json={"answer": 42})
+    resp = getattr(client, method)("/octocat", **kwargs)
     result = resp.json()
     assert result == {"answer": 42}
+    assert resp.request.headers["Authorization"] == "Bearer abc"
+    if "data" in kwargs:
+        assert json.loads(resp.request.body) == kwargs["data"]
+        assert resp.request.headers["Content-Type"] == "application/json"
+    else:
+        assert resp.request.body is None
 
-    responses.post(url, status=200, json={"answer": 42})
-    resp = client.post("/octocat", data={"foo": "bar"})
-    result = resp.json()
-    assert result == {"answer": 42}
 
-    responses.put(url, status=200, json={"answer": 42})
-    resp = client.put("/octocat", data={"foo": "bar"})
-    result = resp.json()
-    assert result == {"answer": 42}
+@pytest.mark.parametrize("query", ("/octocat", "octocat"))
+def test_sync_client_rest_url(responses, sync_client, query):
+    url = f"{GITHUB_API_ENDPOINT}/octocat"
+    responses.get(url, status=200, json={"answer": 42})
+    resp = sync_client.get(query)
+    assert resp.url == url
 
-    responses.patch(url, status=200, json={"answer": 42})
-    resp = client.patch("/octocat", data={"foo": "bar"})
-    result = resp.json()
-    assert result == {"answer": 42}
 
+def test_sync_client_rest_delete(responses, sync_client):
+    url = f"{GITHUB_API_ENDPOINT}/octocat"
     responses.delete(url, status=200)
-    client.delete("/octocat")
+    assert sync_client.delete("/octocat") is None
     resp = responses.calls[-1].response
     assert resp.url == url
     assert resp.request.method == "DELETE"
+    assert resp.request.body is None
     assert resp.status_code == 200
 
-    responses.get(url, status=401)
+
+def test_sync_client_rest_error(responses, sync_client):
+    responses.get(f"{GITHUB_API_ENDPOINT}/octocat", status=401)
     with pytest.raises(HTTPError):
-        resp = client.get("/octocat")
+        resp = sync_client.get("/octocat")
         resp.raise_for_status()
 
 
-@pytest.mark.asyncio
-async def test_async_client_rest_with_text(aioresponses, async_client):
-    client = async_client
+@pytest.mark.asyncio(scope="module")
+async def test_async_client_rest_with_text(aioresponses, shared_async_client):
+    client = shared_async_client
     text = "Favour focus over features"
     aioresponses.get(
         f"{GITHUB_API_ENDPOINT}/octocat",
@@ -207,20 +500,100 @@ def test_sync_client_rest_with_text(responses, sync_client):
     assert result == text
 
 
-@pytest.mark.asyncio
-async def test_async_client_graphql(aioresponses, async_client):
-    client = async_client
+@pytest.mark.asyncio(scope="module")
+@pytest.mark.parametrize("query", (_VIEWER_QUERY, _VIEWER_DOCUMENT), ids=("str", "doc"))
+async def test_async_client_graphql(aioresponses, shared_async_client, query):
+    client = shared_async_client
     aioresponses.post(
         GITHUB_GRAPHQL_ENDPOINT, status=200, payload={"data": {"foo": "bar"}}
     )
-    query = "query { viewer { login }}"
     result = await client.execute(query)
     assert result == {"foo": "bar"}
 
 
-def test_sync_client_graphql(responses, sync_client):
+@pytest.mark.parametrize("query", (_VIEWER_QUERY, _VIEWER_DOCUMENT), ids=("str", "doc"))
+def test_sync_client_graphql(responses, sync_client, query):
     client = sync_client
     responses.post(GITHUB_GRAPHQL_ENDPOINT, status=200, json={"data": {"foo": "bar"}})
-    query = "query { viewer { login }}"
     result = client.execute(query)
     assert result == {"foo": "bar"}
+
+
+def test_parse_cached():
+    client_mod._parse.cache_clear()
+    query = _VIEWER_QUERY
+    document = client_mod._parse(query)
+    assert client_mod._parse(query) is document
+    assert client_mod._parse.cache_info().hits == 1
+
+
+def test_json_dumps_no_orjson(mocker):
+    mocker.patch.object(client_mod, "orjson", None)
+    assert client_mod._json_dumps({"foo": "bar"}) == '{"foo": "bar"}'
+    assert client_mod._requests_json_kwargs({"foo": "bar"}) == {"json": {"foo": "bar"}}
+
+
+def test_json_dumps_orjson():
+    pytest.importorskip("orjson")
+    assert client_mod._json_dumps({"foo": "bar"}) == '{"foo":"bar"}'
+    assert client_mod._requests_json_kwargs({"foo": "bar"}) == {
+        "data": b'{"foo":"bar"}',
+        "headers": {"Content-Type": "application/json"},
+    }
+    assert client_mod._requests_json_kwargs(None) == {"json": None}
+
+
+@pytest.mark.parametrize(
+    "data",
+    (
+        pytest.param({1: "a"}, id="non-str key"),
+        pytest.param({"foo": 2**64}, id="big int"),
+    ),
+)
+def test_json_dumps_orjson_matches_json(data):
+    pytest.importorskip("orjson")
+    expected = json.dumps(data)
+    assert json.loads(client_mod._json_dumps(data)) == json.loads(expected)
+    kwargs = client_mod._requests_json_kwargs(data)
+    body = kwargs["data"] if "data" in kwargs else json.dumps(kwargs["json"])
+    assert json.loads(body) == json.loads(expected)
+
+
+@pytest.mark.parametrize(
+    "value,expected",
+    (
+        pytest.param(float("nan"), "null", id="nan"),
+        pytest.param(date(2024, 1, 2), '"2024-01-02"', id="date"),
+    ),
+)
+def test_json_dumps_orjson_differences(value, expected):
+    # These differ from `json`, as documented in the README.
+    pytest.importorskip("orjson")
+    assert client_mod._json_dumps({"x": value}) == f'{{"x":{expected}}}'
+
+
+def test_sync_loop_thread_uvloop(mocker):
+    loop = asyncio.new_event_loop()
+    mock_uvloop = mocker.patch.object(client_mod, "uvloop")
+    mock_uvloop.new_event_loop.return_value = loop
+    mocker.patch.object(client_mod._SyncLoopThread, "_loop", None)
+
+    assert client_mod._SyncLoopThread.get_loop() is loop
+    assert client_mod._SyncLoopThread.run(asyncio.sleep(0, "done")) == "done"
+    mock_uvloop.new_event_loop.assert_called_once_with()
+
+    loop.call_soon_threadsafe(loop.stop)
+    while loop.is_running():
+        time.sleep(0.01)
+    loop.close()
+
+
+def test_sync_loop_thread_real_uvloop():
+    uvloop = pytest.importorskip("uvloop")
+    assert isinstance(client_mod._SyncLoopThread.get_loop(), uvloop.Loop)
+
+
+@pytest.mark.asyncio
+async def test_async_tests_run_on_uvloop():
+    uvloop = pytest.importorskip("uvloop")
+    assert isinstance(asyncio.get_running_loop(), uvloop.Loop)
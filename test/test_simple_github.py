@@ -1,65 +1,125 @@
+import asyncio
+
 import pytest
+import pytest_asyncio
+from aiohttp.test_utils import TestServer
+from fake_github import INSTALLATION_ID, INSTALLATION_TOKEN, make_app
 
-from simple_github import AppClient, PublicClient, TokenClient
-from simple_github.client import GITHUB_API_ENDPOINT
+from simple_github import AppClient, PublicClient, TokenClient, _is_async_context
+from simple_github import client as client_mod
+from simple_github.client import AsyncClient, SyncClient
 
 
-@pytest.mark.asyncio
-async def test_public_client(aioresponses):
-    aioresponses.get(
-        f"{GITHUB_API_ENDPOINT}/octocat", status=200, payload={"foo": "bar"}
-    )
+# Module scoped rather than in conftest.py, as pytest-asyncio 0.23 can't run
+# conftest fixtures with a wider scope in the event loop of the module using
+# them.
+@pytest_asyncio.fixture(scope="module")
+async def fake_github_server():
+    """Serve `fake_github` in process, and point the clients at it.
+
+    Tests using it must run in the module's event loop, with
+    `@pytest.mark.asyncio(scope="module")`, and create their clients after
+    the fixture has started.
+    """
+    requests = []
+    async with TestServer(make_app(requests)) as server:
+        url = str(server.make_url("")).rstrip("/")
+        with pytest.MonkeyPatch.context() as mp:
+            mp.setattr(client_mod, "GITHUB_API_ENDPOINT", url)
+            mp.setattr(client_mod, "GITHUB_GRAPHQL_ENDPOINT", f"{url}/graphql")
+            yield requests
 
-    async with PublicClient() as client:
-        resp = await client.get("/octocat")
-        result = await resp.json()
-        assert result == {"foo": "bar"}
+
+@pytest.fixture
+def fake_github(fake_github_server):
+    """The requests made to `fake_github` during the test, as tuples of
+    method, path and `Authorization` header.
+    """
+    fake_github_server.clear()
+    return fake_github_server
+
+
+def test_is_async_context():
+    assert _is_async_context() is False
 
 
 @pytest.mark.asyncio
-async def test_token_client(aioresponses):
-    aioresponses.get(
-        f"{GITHUB_API_ENDPOINT}/octocat", status=200, payload={"foo": "bar"}
-    )
+async def test_is_async_context_running_loop():
+    assert _is_async_context() is True
 
-    async with TokenClient("abc") as client:
-        resp = await client.get("/octocat")
-        result = await resp.json()
-        assert result == {"foo": "bar"}
+
+def test_sync_factory():
+    with PublicClient() as client:
+        assert isinstance(client, SyncClient)
 
 
 @pytest.mark.asyncio
-async def test_app_client(aioresponses, privkey):
-    aioresponses.get(
-        f"{GITHUB_API_ENDPOINT}/octocat", status=200, payload={"foo": "bar"}
-    )
+async def test_async_factory():
+    async with PublicClient() as client:
+        assert isinstance(client, AsyncClient)
 
-    async with AppClient(id=123, privkey=privkey) as client:
+
+@pytest.mark.asyncio(scope="module")
+@pytest.mark.parametrize(
+    "factory,auth",
+    (
+        pytest.param(lambda privkey: PublicClient(), None, id="public"),
+        pytest.param(lambda privkey: TokenClient("abc"), "Bearer abc", id="token"),
+        pytest.param(
+            lambda privkey: AppClient(id=123, privkey=privkey), "Bearer ey", id="app"
+        ),
+    ),
+)
+async def test_client(fake_github, privkey, factory, auth):
+    async with factory(privkey) as client:
         resp = await client.get("/octocat")
         result = await resp.json()
         assert result == {"foo": "bar"}
 
+        result = await client.execute("query { viewer { login }}")
+        assert result == {"viewer": {"login": "octocat"}}
+
+    assert [(method, path) for method, path, _ in fake_github] == [
+        ("GET", "/octocat"),
+        ("POST", "/graphql"),
+    ]
+    for _, _, header in fake_github:
+        if auth is None:
+            assert header is None
+        else:
+            assert header.startswith(auth)
 
-@pytest.mark.asyncio
-async def test_app_installation_client(aioresponses, privkey):
-    owner = "owner"
-    inst_id = 1
-
-    aioresponses.get(
-        f"{GITHUB_API_ENDPOINT}/app/installations",
-        status=200,
-        payload=[{"id": inst_id, "account": {"login": owner}}],
-    )
-    aioresponses.post(
-        f"{GITHUB_API_ENDPOINT}/app/installations/{inst_id}/access_tokens",
-        status=200,
-        payload={"token": "789"},
-    )
-    aioresponses.get(
-        f"{GITHUB_API_ENDPOINT}/octocat", status=200, payload={"foo": "bar"}
-    )
 
+@pytest.mark.asyncio(scope="module")
+async def test_app_installation_client(fake_github, privkey):
+    owner = "owner"
     async with AppClient(id=123, privkey=privkey, owner=owner) as client:
         resp = await client.get("/octocat")
         result = await resp.json()
         assert result == {"foo": "bar"}
+
+    assert [(method, path) for method, path, _ in fake_github] == [
+        ("GET", f"/users/{owner}/installation"),
+        ("POST", f"/app/installations/{INSTALLATION_ID}/access_tokens"),
+        ("GET", "/octocat"),
+    ]
+    # The app's JWT is used to create the installation token
+    assert fake_github[0][2].startswith("Bearer ey")
+    assert fake_github[1][2].startswith("Bearer ey")
+    assert fake_github[2][2] == f"Bearer {INSTALLATION_TOKEN}"
+
+
+@pytest.mark.asyncio(scope="module")
+async def test_app_installation_client_concurrent(fake_github, privkey):
+    owner = "owner"
+    async with AppClient(id=123, privkey=privkey, owner=owner) as client:
+        responses = await asyncio.wait_for(
+            asyncio.gather(*[client.get("/octocat") for _ in range(3)]), timeout=5
+        )
+        assert [resp.status for resp in responses] == [200] * 3
+
+    # The installation token is only created once
+    assert [(method, path) for method, path, _ in fake_github] == [
+        ("GET", f"/users/{owner}/installation"),
+        ("POST", f"/app/installations/{INSTALLATION_ID}/access_tokens"),
+    ] + [("GET", "/octocat")] * 3